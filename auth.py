@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+import cache
+
+PBKDF2_ITERATIONS = 600000
+
+class TokenError(Exception):
+    pass
+
+def b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+# --- PASSWORDS ---
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    """Encode as ``pbkdf2_sha256$<iterations>$<salt>$<hash>``."""
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${b64encode(salt)}${b64encode(digest)}"
+
+def verify_password(password, encoded):
+    try:
+        scheme, iterations, salt, expected = encoded.split("$")
+    except ValueError:
+        return False
+    if scheme != "pbkdf2_sha256":
+        return False
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), b64decode(salt), int(iterations))
+    return hmac.compare_digest(digest, b64decode(expected))
+
+# Compared against when the username is unknown, so both paths cost one KDF run.
+DUMMY_HASH = "pbkdf2_sha256$600000$AAAAAAAAAAAAAAAAAAAAAA$ZCf5sFgmzUyINw9KHbD3D7yfZeEhzG4rZ3uutOc2Yog"
+
+def check_credentials(users, username, password):
+    return verify_password(password, users.get(username, DUMMY_HASH)) and username in users
+
+# --- TOKENS ---
+def load_secret(path):
+    """Shared signing key: ``QBN_TOKEN_SECRET`` or a key file created once and reused by every worker."""
+    if os.getenv("QBN_TOKEN_SECRET"):
+        return os.environ["QBN_TOKEN_SECRET"].encode("utf-8")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(path, "rb") as f:
+                key = f.read()
+            if key:
+                return key
+            time.sleep(0.01)  # another worker is still writing it
+        raise RuntimeError(f"Token secret file {path} is empty")
+    key = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class TokenSigner:
+    """Stateless HMAC-SHA256 bearer tokens: ``base64(claims).base64(signature)``.
+
+    Successful verifications are cached until ``cache_ttl`` or the token's own
+    expiry, whichever is sooner, so the hot path is one dictionary lookup.
+    """
+
+    def __init__(self, secret, ttl=3600, cache_size=10000, cache_ttl=300):
+        self.secret = secret
+        self.ttl = ttl
+        self.verified = cache.TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _sign(self, payload):
+        return b64encode(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, subject):
+        now = int(time.time())
+        claims = {"sub": subject, "iat": now, "exp": now + self.ttl, "jti": secrets.token_hex(8)}
+        payload = b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        claims = self.verified.get(token)
+        if claims is not None:
+            return claims
+        payload, _, signature = token.partition(".")
+        try:
+            valid = bool(signature) and hmac.compare_digest(signature.encode("ascii"), self._sign(payload).encode("ascii"))
+            claims = json.loads(b64decode(payload)) if valid else None
+        except ValueError:
+            raise TokenError("Malformed token")
+        if not valid:
+            raise TokenError("Invalid token signature")
+        remaining = claims.get("exp", 0) - time.time()
+        if remaining <= 0:
+            raise TokenError("Token expired")
+        self.verified.set(token, claims, ttl=min(self.verified.ttl, remaining))
+        return claims
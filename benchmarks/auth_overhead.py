@@ -0,0 +1,87 @@
+"""Per-request cost of bearer-token verification.
+
+Reports raw ``TokenSigner.verify`` time (cold and cached) and the latency of
+two otherwise identical in-process routes, one behind ``main.authenticated``.
+
+    python benchmarks/auth_overhead.py --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QBN_LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="qbn-auth-"), "log.jsonl"))
+
+import httpx
+from fastapi import Depends, FastAPI
+
+import main
+
+
+def per_call_us(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def route_latency_us(client, path, headers, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        r = await client.get(path, headers=headers)
+        assert r.status_code == 200, r.text
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def run(n):
+    bench = FastAPI()
+
+    @bench.get("/open")
+    async def open_route():
+        return {"ok": True}
+
+    @bench.get("/secured")
+    async def secured_route(token: dict = Depends(main.authenticated)):
+        return {"ok": True}
+
+    signer = main.token_signer
+    token = signer.issue("admin")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def cold():
+        signer.verified.pop(token)
+        signer.verify(token)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=bench), base_url="http://bench") as client:
+        await route_latency_us(client, "/secured", headers, 100)  # warm-up
+        open_us = await route_latency_us(client, "/open", {}, n)
+        secured_us = await route_latency_us(client, "/secured", headers, n)
+
+    started = time.perf_counter()
+    main.auth.check_credentials(main.USER_DATA, "admin", "Arjuna2026!")
+    login_ms = (time.perf_counter() - started) * 1e3
+
+    return {
+        "requests": n,
+        "verify_cold_us": round(per_call_us(cold, n), 2),
+        "verify_cached_us": round(per_call_us(lambda: signer.verify(token), n), 2),
+        "route_open_us": round(open_us, 1),
+        "route_secured_us": round(secured_us, 1),
+        "auth_overhead_us": round(secured_us - open_us, 1),
+        "password_check_ms": round(login_ms, 1),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
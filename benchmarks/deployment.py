@@ -0,0 +1,87 @@
+"""Native ASGI launcher (serve.py) vs the Passenger a2wsgi bridge (passenger_wsgi.py).
+
+Both targets get the same worker count and a fresh log. The bridge is hosted
+by gunicorn sync workers, which is how Passenger runs a WSGI app: one
+request per process at a time, with a2wsgi handing each request over to an
+event loop thread. Each route is driven at each concurrency level.
+
+    pip install a2wsgi gunicorn        # bridge side only
+    python benchmarks/deployment.py --workers 4 --concurrency 1,16,64 --requests 2000
+
+Expect the two to be close at concurrency 1. The gap opens as concurrency
+grows: bridge throughput is capped near workers / latency, while native
+workers multiplex requests on their event loops (and fsyncs via group
+commit).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import load_test
+
+ROOT = load_test.ROOT
+ROUTES = ("GET /v2/profiles", "POST submit-fiat", "GET history")
+
+
+def start(target, port, workers, log_file):
+    env = dict(os.environ, QBN_LOG_FILE=log_file)
+    if target == "native":
+        cmd = [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--host", "127.0.0.1"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "passenger_wsgi:application", "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--worker-class", "sync", "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+async def drive(base_url, concurrencies, requests, routes):
+    import httpx
+    specs = [s for s in load_test.route_specs(0) if s[0] in routes]
+    limits = httpx.Limits(max_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(120.0), limits=limits) as client:
+        r = await client.post("/token", data={"username": "admin", "password": "Arjuna2026!"})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        results = []
+        for concurrency in concurrencies:
+            for spec in specs:
+                results.append(await load_test.measure(client, spec, headers, requests, concurrency))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--db-size", type=int, default=10000)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+
+    report = {"workers": args.workers, "db_size": args.db_size, "results": []}
+    for target in ("native", "passenger-bridge"):
+        log_file = os.path.join(tempfile.mkdtemp(prefix=f"qbn-{target}-"), "database_anc.jsonl")
+        load_test.seed_log(log_file, args.db_size)
+        port = load_test.free_port()
+        server = start(target, port, args.workers, log_file)
+        try:
+            load_test.wait_for_port(port)
+            for row in asyncio.run(drive(f"http://127.0.0.1:{port}", concurrencies, args.requests, ROUTES)):
+                report["results"].append({"target": target, **row})
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    for row in report["results"]:
+        print(f"{row['target']:17} {row['route']:20} c={row['concurrency']:<3} {row['rps']:>9} req/s  p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  errors {row['errors']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Throughput and latency benchmark for every route in main.py.
+
+Each DB size runs in a fresh subprocess against a log pre-seeded with that
+many synthetic records, either in-process through an ASGI client or over
+HTTP against a uvicorn server started for the run. Results (per route:
+requests/s, p50, p99) are written as JSON so runs can be compared.
+
+    python benchmarks/load_test.py --db-sizes 1000,100000 --concurrency 1,32
+    python benchmarks/load_test.py --target uvicorn --db-sizes 1000000
+    python benchmarks/load_test.py --compare benchmarks/results/old.json --out new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CURRENCIES = ["USD", "EUR", "GBP", "IDR", "SGD", "JPY", "AUD", "CHF", "CAD", "HKD"]
+BATCH_ITEMS = 50
+ADDRESS = {"country": "ID", "city": "Jakarta", "firstLine": "Jl. Sudirman 1", "state": "DKI", "postCode": "10220"}
+
+
+# --- SEEDING ---
+def synthetic_record(i, rng):
+    stamp = datetime.now(timezone.utc).isoformat()
+    kind = i % 6
+    if kind == 0:
+        # One account in ten uses a real code, so GET /v1/accounts?currency=USD grows with the log.
+        currency = rng.choice(CURRENCIES) + ("" if i % 60 == 0 else str(i % 30))
+        return {"action": "ACCOUNT_CREATED", "timestamp": stamp, "data": {"id": i, "currency": currency, "accountHolderName": f"Seed {i}"}}
+    if kind == 1:
+        return {"action": "TRANSFER_INIT", "timestamp": stamp, "data": {"id": i, "status": "PROCESSING", "customerTransactionId": f"seed-{i}"}}
+    if kind == 2:
+        return {"action": "REMITTANCE_CREATED", "timestamp": stamp, "data": {"transactionId": f"seed-{i}", "status": "COMPLETED"}}
+    tx_type = ("FIAT", "CRYPTO", "VISA_CARD")[kind - 3]
+    return {"id": f"SEED-{tx_type}-{i}", "type": tx_type, "timestamp": stamp, "details": {"amount": rng.random() * 1000, "currency": "USD"}}
+
+def seed_log(path, size):
+    import storage
+    rng = random.Random(size)
+    with open(path, "wb") as out:
+        for start in range(0, size, 10000):
+            out.write(b"".join(storage.encode_record(synthetic_record(i, rng)) for i in range(start, min(size, start + 10000))))
+
+
+# --- REQUEST MIX ---
+QUOTE = {"sourceCurrency": "USD", "targetCurrency": "IDR", "targetAmount": 1000.0, "payOut": "BANK_TRANSFER", "preferredPayIn": "BANK_TRANSFER", "targetAccount": 1}
+QUOTE_POOL = []
+
+def unique():
+    return uuid.uuid4().hex
+
+async def fill_quote_pool(client, headers, n):
+    """Quotes are single-use, so each timed transfer consumes one fetched beforehand."""
+    for _ in range(n):
+        r = await client.post("/v3/profiles/888168/quotes", json=QUOTE, headers=headers)
+        r.raise_for_status()
+        QUOTE_POOL.append(r.json()["id"])
+
+SETTLEMENTS = {
+    "confirm-crypto": lambda: {"network": "ERC-20", "asset_type": "USDT", "amount": 10.0, "transaction_hash": "0x" + unique(), "payout_master_wallet": "0xabc"},
+    "submit-fiat": lambda: {"sender_bank": "Mandiri", "account_name": "Bench", "amount": 10.0, "currency": "USD", "swift_code": "BMRIIDJA", "payout_wallet": "0xabc"},
+    "process-card": lambda: {"card_id": unique(), "status": "ACTIVE", "balance": 10.0, "currency": "USD", "payout_wallet": "0xabc", "metadata": {}},
+    "vmml-institutional": lambda: {"card_number": "4111111111111111", "amount": 10.0, "payout_master_wallet": "0xabc", "metadata": {}},
+}
+
+def route_specs(login_requests):
+    """(name, method, path, body factory, kind, request cap) for every route."""
+    account = {"currency": "USD", "type": "aba", "profile": 888168, "ownedByCustomer": True, "accountHolderName": "Bench Holder",
+               "details": {"legalType": "BUSINESS", "abartn": "026009593", "accountNumber": "12345678", "accountType": "CHECKING", "address": ADDRESS, "email": "bench@example.com"}}
+    settlements = [(f"POST {name}", "POST", f"/api/v1/settlement/{name}", body, "json", None) for name, body in SETTLEMENTS.items()]
+    batches = [(f"POST {name}/batch", "POST", f"/api/v1/settlement/{name}/batch", lambda body=body: [body() for _ in range(BATCH_ITEMS)], "json", None)
+               for name, body in SETTLEMENTS.items()]
+    return [
+        ("GET /docs", "GET", "/docs", None, None, None),
+        ("GET /docs/guide", "GET", "/docs/guide", None, None, None),
+        ("GET /openapi.json", "GET", "/openapi.json", None, None, None),
+        ("POST /token", "POST", "/token", lambda: {"username": "admin", "password": "Arjuna2026!"}, "form", login_requests),
+        ("GET /v2/profiles", "GET", "/v2/profiles", None, None, None),
+        ("GET /v1/accounts", "GET", "/v1/accounts?currency=USD", None, None, None),
+        ("POST /v1/accounts", "POST", "/v1/accounts", lambda: account, "json", None),
+        ("POST quotes", "POST", "/v3/profiles/888168/quotes", lambda: QUOTE, "json", None),
+        ("POST /v1/transfers", "POST", "/v1/transfers", lambda: {"targetAccount": 1, "quoteUuid": QUOTE_POOL.pop(), "customerTransactionId": unique(), "details": {"reference": "bench"}}, "json", None),
+        ("POST payments", "POST", "/v3/profiles/888168/transfers/1/payments", lambda: {"type": "BALANCE"}, "json", None),
+        *settlements,
+        *batches,
+        ("POST remittances", "POST", "/gateway/integration/remittances", lambda: {"senderBankOfficerFullName": "Bench Officer", "correspondentBankId": "1", "bankId": "2",
+            "receiverDetails": {"externalId": unique(), "firstName": "A", "lastName": "B", "email": "a@b.c", "dob": "1990-01-01", "phoneNumber": None, "companyName": "C", "address": ADDRESS, "accountNumber": "1"}}, "json", None),
+        ("GET history", "GET", "/api/v1/settlement/history?limit=100", None, None, None),
+    ]
+
+
+# --- MEASUREMENT ---
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def measure(client, spec, headers, requests, concurrency):
+    name, method, path, body, kind, cap = spec
+    total = min(requests, cap) if cap else requests
+    latencies, errors, issued = [], 0, 0
+    if name == "POST /v1/transfers":
+        await fill_quote_pool(client, headers, total)
+
+    async def one():
+        nonlocal errors, issued
+        while issued < total:
+            issued += 1
+            payload = body() if body else None
+            started = time.perf_counter()
+            r = await client.request(method, path, headers=headers, **({kind if kind == "json" else "data": payload} if payload is not None else {}))
+            latencies.append(time.perf_counter() - started)
+            errors += r.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "route": name, "requests": total, "errors": errors, "concurrency": concurrency,
+        "rps": round(total / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1e3, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1e3, 3),
+    }
+
+async def run_suite(client, requests, concurrencies, login_requests):
+    r = await client.post("/token", data={"username": "admin", "password": "Arjuna2026!"})
+    r.raise_for_status()
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    results = []
+    for concurrency in concurrencies:
+        for spec in route_specs(login_requests):
+            results.append(await measure(client, spec, headers, requests, concurrency))
+    return results
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"uvicorn did not start on port {port}")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_one_size(args):
+    """Body of the per-size subprocess: seed, start the target, measure, print JSON."""
+    import httpx
+    workdir = tempfile.mkdtemp(prefix=f"qbn-load-{args.db_size}-")
+    log_file = os.path.join(workdir, "database_anc.jsonl")
+    started = time.perf_counter()
+    seed_log(log_file, args.db_size)
+    seed_seconds = time.perf_counter() - started
+    os.environ["QBN_LOG_FILE"] = log_file
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    timeout = httpx.Timeout(120.0)
+
+    async def in_process():
+        import main
+        main.setup_openapi()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=timeout) as client:
+            results = await run_suite(client, args.requests, concurrencies, args.login_requests)
+        await main.writer.close()
+        return results
+
+    async def over_http(base_url):
+        limits = httpx.Limits(max_connections=max(concurrencies))
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+            return await run_suite(client, args.requests, concurrencies, args.login_requests)
+
+    server = None
+    if args.target == "asgi":
+        results = asyncio.run(in_process())
+    else:
+        port = free_port()
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", "--workers", str(args.workers)]
+        server = subprocess.Popen(cmd, cwd=ROOT, env=os.environ.copy())
+        try:
+            wait_for_port(port)
+            results = asyncio.run(over_http(f"http://127.0.0.1:{port}"))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    for row in results:
+        row["db_size"] = args.db_size
+    print(json.dumps({"db_size": args.db_size, "seed_seconds": round(seed_seconds, 2), "results": results}))
+
+
+def compare(old, new):
+    before = {(r["db_size"], r["concurrency"], r["route"]): r for r in old["results"]}
+    print(f"{'route':30} {'db':>8} {'conc':>5} {'p99 old':>9} {'p99 new':>9} {'rps old':>9} {'rps new':>9}")
+    for r in new["results"]:
+        o = before.get((r["db_size"], r["concurrency"], r["route"]))
+        if o:
+            print(f"{r['route']:30} {r['db_size']:>8} {r['concurrency']:>5} {o['p99_ms']:>9} {r['p99_ms']:>9} {o['rps']:>9} {r['rps']:>9}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route per concurrency level")
+    parser.add_argument("--login-requests", type=int, default=20, help="POST /token runs a deliberately slow KDF")
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (--target uvicorn)")
+    parser.add_argument("--out", default=None, help="defaults to benchmarks/results/<utc timestamp>.json")
+    parser.add_argument("--compare", default=None, help="earlier result file to diff against")
+    parser.add_argument("--db-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.db_size is not None:
+        return run_one_size(args)
+
+    runs = []
+    for size in (int(s) for s in args.db_sizes.split(",")):
+        cmd = [sys.executable, os.path.abspath(__file__), "--db-size", str(size), "--concurrency", args.concurrency, "--requests", str(args.requests),
+               "--login-requests", str(args.login_requests), "--target", args.target, "--workers", str(args.workers)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+        print(f"db_size={size}: done", file=sys.stderr)
+
+    report = {
+        "meta": {"created": datetime.now(timezone.utc).isoformat(), "target": args.target, "workers": args.workers, "python": platform.python_version(), "platform": platform.platform()},
+        "seed_seconds": {str(r["db_size"]): r["seed_seconds"] for r in runs},
+        "results": [row for r in runs for row in r["results"]],
+    }
+    out_path = args.out or os.path.join(ROOT, "benchmarks", "results", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    for row in report["results"]:
+        print(f"{row['route']:30} db={row['db_size']:<8} c={row['concurrency']:<3} {row['rps']:>9} req/s  p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  errors {row['errors']}")
+    print(f"saved {out_path}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,11 @@
+# gunicorn -c gunicorn_conf.py main:app
+import serve
+
+bind = f"{serve.HOST}:{serve.PORT}"
+workers = serve.autotune_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = serve.GRACEFUL_TIMEOUT
+timeout = 60
+keepalive = 5
+# Each worker opens its own log handles and claims its own id slot after start-up.
+preload_app = False
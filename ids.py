@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX hosts: worker id falls back to the pid
+    fcntl = None
+
+# --- ID LAYOUT ---
+# 53 bits so integer ids stay exact in JavaScript clients:
+#   41 bits milliseconds since EPOCH_MS | 5 bits worker | 7 bits sequence
+EPOCH_MS = 1767225600000  # 2026-01-01T00:00:00Z
+WORKER_BITS = 5
+SEQUENCE_BITS = 7
+MAX_WORKERS = 1 << WORKER_BITS
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32, sorts like the integer
+ENCODED_LEN = 11
+
+
+def encode(value):
+    chars = []
+    for _ in range(ENCODED_LEN):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+def decode(text):
+    value = 0
+    for ch in text.upper():
+        value = (value << 5) | ALPHABET.index(ch)
+    return value
+
+def id_key(value):
+    """Numeric sort key for an integer id or a ``QBN-<TYPE>-<base32>`` id; ``None`` for legacy formats."""
+    if isinstance(value, int):
+        return value
+    suffix = str(value).rsplit("-", 1)[-1]
+    if len(suffix) != ENCODED_LEN:
+        return None
+    try: return decode(suffix)
+    except ValueError: return None
+
+
+def claim_worker_id(lock_dir):
+    """Hold an exclusive lock on one of ``MAX_WORKERS`` slot files for the life of the process.
+
+    ``QBN_WORKER_ID`` is inherited by every worker of a host, so it only sets
+    where the search starts: workers sharing a host still lock distinct slots.
+    """
+    base = int(os.getenv("QBN_WORKER_ID", "0"))
+    if fcntl is None:
+        return (base if os.getenv("QBN_WORKER_ID") else os.getpid()) % MAX_WORKERS, None
+    for slot in ((base + i) % MAX_WORKERS for i in range(MAX_WORKERS)):
+        fd = os.open(os.path.join(lock_dir, f".qbn-worker-{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot, fd
+        except OSError:
+            os.close(fd)
+    raise RuntimeError(f"All {MAX_WORKERS} worker id slots in {lock_dir} are taken")
+
+
+class IdGenerator:
+    """Monotonic, time-sortable ids that are unique across threads and worker processes.
+
+    When the 128 sequence numbers of a millisecond run out, the generator
+    borrows the next millisecond instead of sleeping, so bursts stay ordered.
+    Forked children claim their own worker slot.
+    """
+
+    def __init__(self, lock_dir="."):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._last = 0
+        self._slot_fd = None
+        self._claim()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._claim)
+
+    def _claim(self):
+        self._lock = threading.Lock()
+        if self._slot_fd is not None:
+            # Inherited from the parent; closing it leaves the parent's lock in place.
+            os.close(self._slot_fd)
+        self.worker_id, self._slot_fd = claim_worker_id(self.lock_dir)
+        self._last = 0
+
+    def next_int(self):
+        now = (int(time.time() * 1000) - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)
+        with self._lock:
+            last_ms = self._last & ~SEQUENCE_MASK
+            if now > last_ms:
+                value = now | (self.worker_id << SEQUENCE_BITS)
+            elif self._last & SEQUENCE_MASK < SEQUENCE_MASK:
+                value = self._last + 1
+            else:
+                value = last_ms + (1 << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS)
+            self._last = value
+            return value
+
+    def next_str(self, prefix):
+        return f"{prefix}-{encode(self.next_int())}"
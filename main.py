@@ -1,34 +1,168 @@
+import asyncio
+import hashlib
+import inspect
 import json
+import math
 import os
+import sys
 import uuid
-import pytz
-from fastapi import FastAPI, Depends, HTTPException, Query
+import assets
+import auth
+import cache
+import ids
+import metrics
+import quotes
+import storage
+import time
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
-from datetime import datetime
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError, model_validator
+from datetime import datetime, timezone
+from itertools import islice
 from typing import Optional, List, Dict
 
+if __name__ == "__main__":
+    # Hand `python main.py` over to the launcher before any storage is opened: uvicorn
+    # imports this file again as `main`, and a second copy would hold its own log
+    # handles, fsync thread, index and id slot for the life of the server.
+    serve_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+    os.execv(sys.executable, [sys.executable, serve_py, *sys.argv[1:]])
+
 # --- CONFIGURATION & DATABASE ---
 DB_FILE = "database_anc.json"
-
-def save_to_db(data):
-    transactions = []
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r") as f:
-            try: transactions = json.load(f)
-            except: transactions = []
-    transactions.append(data)
-    with open(DB_FILE, "w") as f:
-        json.dump(transactions, f, indent=4)
+LOG_FILE = os.getenv("QBN_LOG_FILE", "database_anc.jsonl")
+STORAGE_BACKEND = os.getenv("QBN_STORAGE", "jsonl")
+WRITE_QUEUE_DEPTH = int(os.getenv("QBN_WRITE_QUEUE_DEPTH", "1024"))
+WRITE_BATCH = int(os.getenv("QBN_WRITE_BATCH", "256"))
+MAX_BATCH_ITEMS = int(os.getenv("QBN_MAX_BATCH_ITEMS", "2000"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("QBN_IDEMPOTENCY_CACHE_SIZE", "100000"))
+IDEMPOTENCY_TTL = float(os.getenv("QBN_IDEMPOTENCY_TTL", "86400"))
+TOKEN_TTL = int(os.getenv("QBN_TOKEN_TTL", "3600"))
+TOKEN_CACHE_TTL = float(os.getenv("QBN_TOKEN_CACHE_TTL", "300"))
+QUOTE_TTL = int(os.getenv("QBN_QUOTE_TTL", "1800"))
+RATES_FILE = os.getenv("QBN_RATES_FILE")
+RATE_REFRESH_INTERVAL = float(os.getenv("QBN_RATE_REFRESH_INTERVAL", "60"))
+TOKEN_SECRET_FILE = os.path.join(os.path.dirname(os.path.abspath(LOG_FILE)), ".qbn-token-secret")
+QUOTE_DIR = os.getenv("QBN_QUOTE_DIR", os.path.join(os.path.dirname(os.path.abspath(LOG_FILE)), ".qbn-quotes"))
+
+if STORAGE_BACKEND == "jsonl":
+    db = storage.open_storage("jsonl", LOG_FILE, legacy_path=DB_FILE)
+else:
+    db = storage.open_storage(STORAGE_BACKEND, DB_FILE)
+tx_index = storage.TransactionIndex()
+tx_index.sync(db)
+id_gen = ids.IdGenerator(lock_dir=os.path.dirname(os.path.abspath(LOG_FILE)))
+writer = storage.AsyncWriter(db, queue_depth=WRITE_QUEUE_DEPTH, max_batch=WRITE_BATCH, on_commit=lambda: tx_index.sync(db))
+
+async def save_to_db(data):
+    return await save_many_to_db([data])
+
+async def save_many_to_db(records, guard=None):
+    """Persist ``records`` in one write; ``guard`` runs under the log's write lock first (see ``storage.AsyncWriter``)."""
+    stamp = datetime.now(timezone.utc).isoformat()
+    for data in records:
+        data.setdefault("timestamp", stamp)
+    return await writer.submit(records, guard)
+
+# --- IDEMPOTENCY ---
+IDEMPOTENCY_ACTION = "IDEMPOTENCY_KEY"
+idem_cache = cache.TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+idem_inflight = {}
+
+class AlreadyCommitted(Exception):
+    """Raised by the idempotency claim when another worker committed the key first."""
+    def __init__(self, entry):
+        super().__init__(entry["request_hash"])
+        self.entry = entry
+
+def idempotency_entry(record):
+    return {"request_hash": record["request_hash"], "response": record["response"]}
+
+def claim_key(full_key, guard=None):
+    """Write guard: under the log's file lock, refuse a key another worker already committed, then run ``guard``."""
+    def claim():
+        tx_index.sync(db)
+        record = tx_index.get_idempotent(full_key)
+        if record is not None:
+            raise AlreadyCommitted(idempotency_entry(record))
+        if guard is not None:
+            guard()
+    return claim
+
+def request_digest(data):
+    payload = data.dict() if isinstance(data, BaseModel) else data
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def replay(entry, digest):
+    if entry["request_hash"] != digest:
+        raise HTTPException(status_code=409, detail="Idempotency key was already used with a different request body")
+    return JSONResponse(content=entry["response"], headers={"Idempotent-Replayed": "true"})
+
+async def run_build(build):
+    built = build()
+    return (await built) if inspect.isawaitable(built) else built
+
+async def idempotent(scope, key, data, build, guard=None, digest=None):
+    """Run ``build() -> (record or records, response)`` (sync or async) and persist it once per ``scope``/``key``.
+
+    Replays are answered from the LRU cache, then from the in-memory index
+    (which also covers other workers after a sync); only a true miss writes.
+    The key, request hash and response go in a separate ``IDEMPOTENCY_KEY``
+    record, committed in the same write as the transaction records. The key
+    is claimed under the log's file lock, so when two workers race the loser
+    replays the winner's response instead of writing a duplicate.
+    """
+    if not key:
+        records, res = await run_build(build)
+        if records: await save_many_to_db(records if isinstance(records, list) else [records], guard)
+        return res
+    full_key, digest = f"{scope}:{key}", digest or request_digest(data)
+    entry = idem_cache.get(full_key)
+    if entry is None:
+        record = tx_index.get_idempotent(full_key)
+        if record is None:
+            await run_in_threadpool(tx_index.sync, db)
+            record = tx_index.get_idempotent(full_key)
+        if record is not None:
+            entry = idempotency_entry(record)
+            idem_cache.set(full_key, entry)
+    if entry is not None:
+        return replay(entry, digest)
+    if full_key in idem_inflight:
+        return replay(await asyncio.shield(idem_inflight[full_key]), digest)
+
+    future = idem_inflight[full_key] = asyncio.get_running_loop().create_future()
+    try:
+        records, res = await run_build(build)
+        entry = {"request_hash": digest, "response": res}
+        records = records if isinstance(records, list) else [records]
+        try:
+            await save_many_to_db([*records, {"action": IDEMPOTENCY_ACTION, "idempotency_key": full_key, **entry}], claim_key(full_key, guard))
+        except AlreadyCommitted as exc:
+            entry, res = exc.entry, None
+        idem_cache.set(full_key, entry)
+        future.set_result(entry)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        del idem_inflight[full_key]
+    return res if res is not None else replay(entry, digest)
 
 # --- APP INITIALIZATION ---
 app = FastAPI(
     docs_url=None,
     redoc_url=None,
-    openapi_url="/openapi.json",
+    openapi_url=None,
     version="0.5.1"
 )
 
@@ -39,68 +173,102 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-USER_DATA = {"admin": "Arjuna2026!"}
+USER_DATA = {"admin": "pbkdf2_sha256$600000$G_2N3LPPYWJZk9_3XPweqg$iaEyFcG5G4dAMbXZ5yceUc4_PmG_d3Q69IdTS5tiCU8"}
+token_signer = auth.TokenSigner(auth.load_secret(TOKEN_SECRET_FILE), ttl=TOKEN_TTL, cache_ttl=TOKEN_CACHE_TTL)
+
+async def authenticated(token: str = Depends(oauth2_scheme)):
+    try: return token_signer.verify(token)
+    except auth.TokenError as exc:
+        raise HTTPException(status_code=401, detail=str(exc), headers={"WWW-Authenticate": "Bearer"})
+
+# --- QUOTE ENGINE ---
+rate_table = quotes.RateTable(quotes.JsonFileRateSource(RATES_FILE) if RATES_FILE else quotes.StaticRateSource())
+rate_table.refresh()
+quote_book = quotes.QuoteBook(QUOTE_DIR, ttl=QUOTE_TTL)
+rate_refresh_task = quote_sweep_task = None
+QUOTE_UNAVAILABLE = "Quote not found, expired or already used"
+
+async def find_quote(quote_id):
+    """A live quote issued by any worker; whether it is still unused is checked at write time."""
+    quote = quote_book.get(quote_id) or await run_in_threadpool(quote_book.load, quote_id)
+    if quote is None or quotes.expired(quote) or tx_index.get_quote_use(quote_id) is not None:
+        raise HTTPException(status_code=422, detail=QUOTE_UNAVAILABLE)
+    return quote
+
+def quote_unused(quote_id):
+    """Write guard: under the log's file lock, catch up with every worker's writes and refuse a used quote."""
+    def guard():
+        tx_index.sync(db)
+        if tx_index.get_quote_use(quote_id) is not None:
+            raise HTTPException(status_code=422, detail=QUOTE_UNAVAILABLE)
+    return guard
 
 # --- SCHEMAS ---
-class Address(BaseModel):
+class Schema(BaseModel):
+    @model_validator(mode="wrap")
+    @classmethod
+    def timed_validation(cls, data, handler):
+        started = time.perf_counter()
+        try: return handler(data)
+        finally: metrics.VALIDATION_LATENCY.labels(cls.__name__).observe(time.perf_counter() - started)
+
+class Address(Schema):
     country: str; city: str; firstLine: str; state: str; postCode: str
 
-class AccountDetails(BaseModel):
+class AccountDetails(Schema):
     legalType: str; abartn: str; accountNumber: str; accountType: str; address: Address; email: str
 
-class RecipientAccount(BaseModel):
+class RecipientAccount(Schema):
     currency: str; type: str; profile: int; ownedByCustomer: bool; accountHolderName: str; details: AccountDetails
 
-class QuoteRequest(BaseModel):
+class QuoteRequest(Schema):
     sourceCurrency: str; targetCurrency: str; sourceAmount: Optional[float] = None; targetAmount: float; payOut: str; preferredPayIn: str; targetAccount: int; paymentMetadata: Optional[Dict] = None
 
-class TransferRequest(BaseModel):
+class TransferRequest(Schema):
     targetAccount: int; quoteUuid: str; customerTransactionId: str; details: Dict
 
-class CryptoConfirmation(BaseModel):
+class CryptoConfirmation(Schema):
     network: str; asset_type: str; amount: float; transaction_hash: str; payout_master_wallet: str
 
-class CardTransaction(BaseModel):
+class CardTransaction(Schema):
     card_id: str; status: str; balance: float; currency: str; payout_wallet: str; metadata: Dict
 
-class FiatTransfer(BaseModel):
+class FiatTransfer(Schema):
     sender_bank: str; account_name: str; amount: float; currency: str; swift_code: str; payout_wallet: str
 
-class VmmlTransaction(BaseModel):
+class VmmlTransaction(Schema):
     card_number: str; amount: float; payout_master_wallet: str; metadata: Dict
 
-class FundTransferRequest(BaseModel):
+class FundTransferRequest(Schema):
     type: str = "BALANCE"
 
-class RemittanceReceiver(BaseModel):
+class RemittanceReceiver(Schema):
     externalId: str; firstName: str; lastName: str; email: str; dob: str; phoneNumber: Optional[str]; companyName: str; address: Dict; accountNumber: str
 
-class CreateRemittanceRequest(BaseModel):
+class CreateRemittanceRequest(Schema):
     senderBankOfficerFullName: str; receiverDetails: RemittanceReceiver; correspondentBankId: str; bankId: str; remittanceType: str = "DEBIT"
 
 # --- CUSTOM SWAGGER UI ---
-@app.get("/docs", include_in_schema=False)
-async def custom_swagger_ui_html():
-    app.openapi_schema = None
-    wib = pytz.timezone('Asia/Jakarta')
-    init_time = datetime.now(wib).strftime("%A, %B %d, %Y at %H:%M:%S WIB")
+DOCS_TITLE = "Quantum Institutional Gateway"
+OPENAPI_URL = "/openapi.json"
 
-    app.description = f"""
+DOCS_DESCRIPTION = """
 <style>
-    html, body, .swagger-ui {{ background-color: #0d1117 !important; color: #ffffff !important; }}
+    html, body, .swagger-ui { background-color: #0d1117 !important; color: #ffffff !important; }
     .swagger-ui .info .title, .swagger-ui .info p, .swagger-ui .info li,
     .swagger-ui .opblock-tag, .swagger-ui .opblock .opblock-summary-path,
     .swagger-ui .opblock .opblock-summary-description, .swagger-ui .btn,
     .swagger-ui label, .swagger-ui .model-title, .swagger-ui .prop-name,
-    .swagger-ui .opblock-description-wrapper p, .swagger-ui .tabli button {{
+    .swagger-ui .opblock-description-wrapper p, .swagger-ui .tabli button {
         color: #ffffff !important;
-    }}
-    .swagger-ui .opblock {{ background: #161b22 !important; border: 1px solid #30363d !important; }}
-    .swagger-ui .scheme-container {{ background: #161b22 !important; border-bottom: 1px solid #30363d !important; box-shadow: none !important; }}
-    .swagger-ui select, .swagger-ui input {{ background: #0d1117 !important; color: white !important; border: 1px solid #30363d !important; }}
-    .swagger-ui .topbar {{ display: none; }}
+    }
+    .swagger-ui .opblock { background: #161b22 !important; border: 1px solid #30363d !important; }
+    .swagger-ui .scheme-container { background: #161b22 !important; border-bottom: 1px solid #30363d !important; box-shadow: none !important; }
+    .swagger-ui select, .swagger-ui input { background: #0d1117 !important; color: white !important; border: 1px solid #30363d !important; }
+    .swagger-ui .topbar { display: none; }
 </style>
 
 <center>
@@ -120,7 +288,7 @@ async def custom_swagger_ui_html():
 </div>
 
 <h2 style="color: #58a6ff; font-weight: bold;">Quantum Institutional Asset Settlement Protocol (OAS 3.1)</h2>
-<div style="color: #ffffff;">🌐 Status: <span style="color: #3fb950; font-weight: bold;">🟢 [OPERATIONAL]</span> | 🕒 Heartbeat: <span id="live-clock" style="color: #d29922;">{init_time}</span></div>
+<div style="color: #ffffff;">🌐 Status: <span style="color: #3fb950; font-weight: bold;">🟢 [OPERATIONAL]</span> | 🕒 Heartbeat: <span id="live-clock" style="color: #d29922;">Synchronising...</span></div>
 
 <div style="background: rgba(210,153,34,0.1); padding: 12px; border-radius: 6px; border: 1px solid #d29922; margin-top: 20px; max-width: 950px; text-align: left;">
 <marquee style="color: #d29922; font-weight: bold;">⚠️ NOTICE: ISO 20022 Standard Active. Workflow Compliant with Quantum Blockchain Network. ⚠️</marquee>
@@ -166,36 +334,105 @@ async def custom_swagger_ui_html():
     <p style="margin-top: 15px; color: #8b949e; font-size: 12px;">🛡️ Verified by Quantum Security Protocol. Grade 0.5.1</p>
 </div>
 </center>
+"""
 
+# The heartbeat is rendered in the browser, so the cached page never goes stale.
+CLOCK_SCRIPT = """
 <script>
-    function startClock() {{
-        setInterval(function() {{
-            var now = new Date();
-            var options = {{ weekday: 'long', year: 'numeric', month: 'long', day: '2-digit', hour: '2-digit', minute: '2-digit', second: '2-digit', hour12: false, timeZone: 'Asia/Jakarta' }};
-            document.getElementById('live-clock').innerHTML = new Intl.DateTimeFormat('en-GB', options).format(now) + ' WIB';
-        }}, 1000);
-    }}
-    setTimeout(startClock, 1000);
+    setInterval(function() {
+        var clock = document.getElementById('live-clock');
+        if (!clock) return;
+        var options = { weekday: 'long', year: 'numeric', month: 'long', day: '2-digit', hour: '2-digit', minute: '2-digit', second: '2-digit', hour12: false, timeZone: 'Asia/Jakarta' };
+        clock.innerHTML = new Intl.DateTimeFormat('en-GB', options).format(new Date()) + ' WIB';
+    }, 1000);
 </script>
 """
-    return get_swagger_ui_html(
-        openapi_url=app.openapi_url,
-        title="Quantum Institutional Gateway",
+
+docs_assets = {}
+
+def build_docs_assets():
+    """Render the OpenAPI schema, Swagger page and guide once; they only change on deploy."""
+    schema = get_openapi(title=DOCS_TITLE, version=app.version, description=DOCS_DESCRIPTION, routes=app.routes)
+    schema["servers"] = [{"url": "/"}]
+    app.openapi_schema = schema
+    swagger = get_swagger_ui_html(
+        openapi_url=OPENAPI_URL,
+        title=DOCS_TITLE,
         swagger_js_url="https://cdn.jsdelivr.net/npm/swagger-ui-dist@5/swagger-ui-bundle.js",
         swagger_css_url="https://cdn.jsdelivr.net/npm/swagger-ui-dist@5/swagger-ui.css"
-    )
+    ).body.decode("utf-8").replace("</body>", CLOCK_SCRIPT + "</body>")
+    docs_assets.update({
+        OPENAPI_URL: assets.CachedAsset(json.dumps(schema).encode("utf-8"), "application/json"),
+        "/docs": assets.CachedAsset(swagger.encode("utf-8"), "text/html; charset=utf-8"),
+        "/docs/guide": assets.CachedAsset(GUIDE_HTML.encode("utf-8"), "text/html; charset=utf-8"),
+    })
+
+def docs_response(request, path):
+    if not docs_assets:
+        build_docs_assets()
+    return docs_assets[path].response(request)
+
+@app.get("/docs", include_in_schema=False)
+async def custom_swagger_ui_html(request: Request):
+    return docs_response(request, "/docs")
+
+@app.get(OPENAPI_URL, include_in_schema=False)
+async def openapi_json(request: Request):
+    return docs_response(request, OPENAPI_URL)
 
 @app.on_event("startup")
 def setup_openapi():
-    from fastapi.openapi.utils import get_openapi
-    schema = get_openapi(title="Quantum Institutional Gateway", version="0.5.1", description=app.description, routes=app.routes)
-    schema["servers"] = [{"url": "/"}]
-    app.openapi_schema = schema
+    build_docs_assets()
+
+@app.on_event("shutdown")
+async def close_storage():
+    await writer.close()
+    db.close()
+
+# --- METRICS ---
+metrics.REGISTRY.gauge("qbn_db_records", "Records in the in-memory transaction index.", lambda: len(tx_index))
+metrics.REGISTRY.gauge("qbn_db_file_bytes", "Size of the transaction log on disk.", lambda: os.path.getsize(db.path))
+metrics.REGISTRY.gauge("qbn_write_queue_depth", "Submissions waiting for the storage writer.", lambda: writer.pending)
+loop_lag_task = None
+
+@app.on_event("startup")
+async def start_metrics():
+    global loop_lag_task
+    for model in Schema.__subclasses__():
+        metrics.VALIDATION_LATENCY.labels(model.__name__)
+    loop_lag_task = asyncio.get_running_loop().create_task(metrics.monitor_loop_lag())
+
+@app.on_event("startup")
+async def start_rate_refresh():
+    global rate_refresh_task
+    rate_refresh_task = asyncio.get_running_loop().create_task(rate_table.refresh_periodically(RATE_REFRESH_INTERVAL))
+
+@app.on_event("startup")
+async def start_quote_sweep():
+    global quote_sweep_task
+    quote_sweep_task = asyncio.get_running_loop().create_task(quote_book.sweep_periodically(min(QUOTE_TTL, 300)))
+
+@app.on_event("shutdown")
+async def stop_rate_refresh():
+    if rate_refresh_task is not None:
+        rate_refresh_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_quote_sweep():
+    if quote_sweep_task is not None:
+        quote_sweep_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_metrics():
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # --- DOCUMENTATION ENDPOINT (DETAILED) ---
-@app.get("/docs/guide", include_in_schema=False, response_class=HTMLResponse)
-async def get_onboarding_guide():
-    return """
+GUIDE_HTML = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -278,81 +515,215 @@ async def get_onboarding_guide():
     </html>
     """
 
+@app.get("/docs/guide", include_in_schema=False, response_class=HTMLResponse)
+async def get_onboarding_guide(request: Request):
+    return docs_response(request, "/docs/guide")
+
 # --- INSTITUTIONAL PROTOCOL ---
 @app.get("/v2/profiles", tags=["Institutional Protocol"])
-async def get_profiles(token: str = Depends(oauth2_scheme)):
+async def get_profiles(token: dict = Depends(authenticated)):
     return [{"id": 888168, "type": "institutional", "name": "QUANTUM MASTER ADMIN"}]
 
 @app.get("/v1/accounts", tags=["Institutional Protocol"])
-async def get_accounts(currency: str = Query(...), token: str = Depends(oauth2_scheme)):
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r") as f:
-            try:
-                txs = json.load(f)
-                return [t["data"] for t in txs if t.get("action") == "ACCOUNT_CREATED" and t["data"]["currency"] == currency]
-            except: return []
-    return []
+async def get_accounts(currency: str = Query(...), token: dict = Depends(authenticated)):
+    await run_in_threadpool(tx_index.sync, db)
+    return [t["data"] for t in tx_index.find(kind="ACCOUNT_CREATED", currency=currency)]
 
 @app.post("/v1/accounts", tags=["Institutional Protocol"])
-async def create_account(data: RecipientAccount, token: str = Depends(oauth2_scheme)):
-    res = data.dict(); res["id"] = int(datetime.now().timestamp())
-    save_to_db({"action": "ACCOUNT_CREATED", "data": res}); return res
+async def create_account(data: RecipientAccount, token: dict = Depends(authenticated)):
+    res = data.dict(); res["id"] = id_gen.next_int()
+    await save_to_db({"action": "ACCOUNT_CREATED", "data": res}); return res
 
 @app.post("/v3/profiles/{profile_id}/quotes", tags=["Institutional Protocol"])
-async def create_quote(profile_id: int, data: QuoteRequest, token: str = Depends(oauth2_scheme)):
-    return {"id": str(uuid.uuid4()), "profile": profile_id, "targetAmount": data.targetAmount, "status": "READY"}
+async def create_quote(profile_id: int, data: QuoteRequest, token: dict = Depends(authenticated)):
+    if not (math.isfinite(data.targetAmount) and data.targetAmount > 0):
+        raise HTTPException(status_code=422, detail="targetAmount must be a positive amount")
+    rate = rate_table.rate(data.sourceCurrency, data.targetCurrency)
+    if rate is None:
+        raise HTTPException(status_code=422, detail=f"Unsupported currency pair {data.sourceCurrency}/{data.targetCurrency}")
+    quote = quote_book.issue(profile_id, data.sourceCurrency, data.targetCurrency, data.targetAmount, data.targetAccount, rate)
+    await run_in_threadpool(quote_book.remember, quote)
+    return quote
 
 @app.post("/v1/transfers", tags=["Institutional Protocol"])
-async def make_transfer(data: TransferRequest, token: str = Depends(oauth2_scheme)):
-    res = {"id": int(datetime.now().timestamp()), "status": "PROCESSING", "customerTransactionId": data.customerTransactionId}
-    save_to_db({"action": "TRANSFER_INIT", "data": res}); return res
+async def make_transfer(data: TransferRequest, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    async def build():
+        quote = await find_quote(data.quoteUuid)
+        if quote["targetAccount"] != data.targetAccount:
+            raise HTTPException(status_code=422, detail="Quote was issued for a different targetAccount")
+        res = {"id": id_gen.next_int(), "status": "PROCESSING", "customerTransactionId": data.customerTransactionId, "quoteUuid": quote["id"],
+               "sourceCurrency": quote["sourceCurrency"], "targetCurrency": quote["targetCurrency"],
+               "sourceAmount": quote["sourceAmount"], "targetAmount": quote["targetAmount"], "rate": quote["rate"]}
+        return {"action": "TRANSFER_INIT", "data": res, "quote": quote}, res
+    # The guard makes "unused?" and "record the use" one step across all workers.
+    return await idempotent("transfer", idempotency_key or data.customerTransactionId, data, build, guard=quote_unused(data.quoteUuid))
 
 @app.post("/v3/profiles/{profile_id}/transfers/{transfer_id}/payments", tags=["Institutional Protocol"])
-async def fund_transfer(profile_id: int, transfer_id: int, data: FundTransferRequest, token: str = Depends(oauth2_scheme)):
+async def fund_transfer(profile_id: int, transfer_id: int, data: FundTransferRequest, token: dict = Depends(authenticated)):
     return JSONResponse(status_code=201, content={"status": "COMPLETED", "data": {"status": "COMPLETED"}})
 
 # --- SETTLEMENT ASSETS ---
 @app.post("/api/v1/settlement/confirm-crypto", tags=["Settlement Assets"])
-async def confirm_crypto(data: CryptoConfirmation, token: str = Depends(oauth2_scheme)):
-    tx_id = f"QBN-CRYPTO-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    save_to_db({"id": tx_id, "type": "CRYPTO", "details": data.dict()}); return {"status": "SUCCESS", "transaction_id": tx_id}
+async def confirm_crypto(data: CryptoConfirmation, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    def build():
+        tx_id = id_gen.next_str("QBN-CRYPTO")
+        return {"id": tx_id, "type": "CRYPTO", "details": data.dict()}, {"status": "SUCCESS", "transaction_id": tx_id}
+    return await idempotent("CRYPTO", idempotency_key, data, build)
 
 @app.post("/api/v1/settlement/submit-fiat", tags=["Settlement Assets"])
-async def submit_fiat(data: FiatTransfer, token: str = Depends(oauth2_scheme)):
-    tx_id = f"QBN-FIAT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    save_to_db({"id": tx_id, "type": "FIAT", "details": data.dict()}); return {"status": "SUCCESS", "transaction_id": tx_id}
+async def submit_fiat(data: FiatTransfer, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    def build():
+        tx_id = id_gen.next_str("QBN-FIAT")
+        return {"id": tx_id, "type": "FIAT", "details": data.dict()}, {"status": "SUCCESS", "transaction_id": tx_id}
+    return await idempotent("FIAT", idempotency_key, data, build)
 
 @app.post("/api/v1/settlement/process-card", tags=["Settlement Assets"])
-async def process_card(data: CardTransaction, token: str = Depends(oauth2_scheme)):
-    tx_id = f"QBN-VISA-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    save_to_db({"id": tx_id, "type": "VISA_CARD", "details": data.dict()}); return {"status": "SUCCESS", "transaction_id": tx_id}
+async def process_card(data: CardTransaction, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    def build():
+        tx_id = id_gen.next_str("QBN-VISA")
+        return {"id": tx_id, "type": "VISA_CARD", "details": data.dict()}, {"status": "SUCCESS", "transaction_id": tx_id}
+    return await idempotent("VISA_CARD", idempotency_key, data, build)
 
 @app.post("/api/v1/settlement/vmml-institutional", tags=["Settlement Assets"])
-async def process_vmml(data: VmmlTransaction, token: str = Depends(oauth2_scheme)):
-    tx_id = f"QBN-VMML-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    save_to_db({"id": tx_id, "type": "VMML", "details": data.dict()}); return {"status": "SUCCESSFULLY REDEEMED", "transaction_id": tx_id, "auth_code": "8026"}
+async def process_vmml(data: VmmlTransaction, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    def build():
+        tx_id = id_gen.next_str("QBN-VMML")
+        return {"id": tx_id, "type": "VMML", "details": data.dict()}, {"status": "SUCCESSFULLY REDEEMED", "transaction_id": tx_id, "auth_code": "8026"}
+    return await idempotent("VMML", idempotency_key, data, build)
 
 @app.post("/gateway/integration/remittances", tags=["Institutional Protocol"])
-async def create_remittance(data: CreateRemittanceRequest, token: str = Depends(oauth2_scheme)):
-    tx_id = str(uuid.uuid4())
-    res = {"transactionId": tx_id, "status": "COMPLETED", "details": f"Sending to {data.receiverDetails.accountNumber}"}
-    save_to_db({"action": "REMITTANCE_CREATED", "data": res, "input": data.dict()}); return res
+async def create_remittance(data: CreateRemittanceRequest, idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+    def build():
+        res = {"transactionId": str(uuid.uuid4()), "status": "COMPLETED", "details": f"Sending to {data.receiverDetails.accountNumber}"}
+        return {"action": "REMITTANCE_CREATED", "data": res, "input": data.dict()}, res
+    return await idempotent("remittance", idempotency_key or data.receiverDetails.externalId, data, build)
+
+# --- BULK SETTLEMENT ---
+SETTLEMENT_BATCHES = {
+    "confirm-crypto": (CryptoConfirmation, "QBN-CRYPTO", "CRYPTO", {"status": "SUCCESS"}),
+    "submit-fiat": (FiatTransfer, "QBN-FIAT", "FIAT", {"status": "SUCCESS"}),
+    "process-card": (CardTransaction, "QBN-VISA", "VISA_CARD", {"status": "SUCCESS"}),
+    "vmml-institutional": (VmmlTransaction, "QBN-VMML", "VMML", {"status": "SUCCESSFULLY REDEEMED", "auth_code": "8026"}),
+}
+
+def parse_batch_body(body, ndjson):
+    """Return a list of raw items from a JSON array or NDJSON body; unparsable NDJSON lines become ``ValueError`` items."""
+    if ndjson:
+        items = []
+        for line in body.splitlines():
+            if not line.strip(): continue
+            try: items.append(json.loads(line))
+            except ValueError as exc: items.append(exc)
+    else:
+        try: items = json.loads(body or b"null")
+        except ValueError: raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_ITEMS} items")
+    return items
+
+def validate_batch(model, items):
+    """Return ``(results, accepted)``: a REJECTED result per bad item, and ``(slot, details)`` per good one."""
+    results, accepted = [], []
+    for i, item in enumerate(items):
+        try:
+            if isinstance(item, ValueError): raise item
+            if not isinstance(item, dict): raise ValueError("Item must be a JSON object")
+            data = model(**item)
+        except ValidationError as exc:
+            results.append({"index": i, "status": "REJECTED", "errors": json.loads(exc.json())}); continue
+        except ValueError as exc:
+            results.append({"index": i, "status": "REJECTED", "errors": [{"msg": str(exc)}]}); continue
+        accepted.append((len(results), data.dict()))
+        results.append({"index": i})
+    return results, accepted
+
+def batch_openapi(model):
+    ref = {"$ref": f"#/components/schemas/{model.__name__}"}
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": ref}},
+        "application/x-ndjson": {"schema": ref},
+    }}}
+
+def add_settlement_batch_route(path, model, prefix, tx_type, reply):
+    async def settle_batch(request: Request, atomic: bool = Query(False, description="Reject the whole batch if any item is invalid"),
+                           idempotency_key: Optional[str] = Header(None), token: dict = Depends(authenticated)):
+        body = await request.body()
+        ndjson = request.headers.get("content-type", "").startswith(("application/x-ndjson", "application/jsonl"))
+
+        def prepare():
+            # Parsing, validating and hashing up to MAX_BATCH_ITEMS items is tens of ms: keep it off the event loop.
+            items = parse_batch_body(body, ndjson)
+            results, accepted = validate_batch(model, items)
+            digest = request_digest({"atomic": atomic, "items": items}) if idempotency_key else None
+            return len(items), results, accepted, digest
+        count, results, accepted, digest = await run_in_threadpool(prepare)
+        rejected = count - len(accepted)
+        if atomic and rejected:
+            return JSONResponse(status_code=422, content={"committed": 0, "rejected": rejected, "results": [r for r in results if r.get("status") == "REJECTED"]})
+
+        def build():
+            records = []
+            for slot, details in accepted:
+                tx_id = id_gen.next_str(prefix)
+                records.append({"id": tx_id, "type": tx_type, "details": details})
+                results[slot].update({**reply, "transaction_id": tx_id})
+            return records, {"committed": len(records), "rejected": rejected, "results": results}
+        # The whole batch response is the replay payload, so a retried end-of-day file settles once.
+        res = await idempotent(f"{tx_type}:batch", idempotency_key, None, build, digest=digest)
+        return res if isinstance(res, JSONResponse) else await run_in_threadpool(JSONResponse, res)
+
+    settle_batch.__name__ = f"{path.replace('-', '_')}_batch"
+    app.post(f"/api/v1/settlement/{path}/batch", tags=["Settlement Assets"], openapi_extra=batch_openapi(model))(settle_batch)
+
+for _path, _spec in SETTLEMENT_BATCHES.items():
+    add_settlement_batch_route(_path, *_spec)
 
 # --- SYSTEM ---
 @app.get("/api/v1/settlement/history", tags=["System"])
-async def get_history(token: str = Depends(oauth2_scheme)):
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r") as f:
-            try: return json.load(f)
-            except: return []
-    return []
+async def get_history(
+    type: Optional[str] = Query(None, description="CRYPTO, FIAT, VISA_CARD or VMML"),
+    action: Optional[str] = Query(None, description="e.g. ACCOUNT_CREATED, TRANSFER_INIT, REMITTANCE_CREATED"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    from_id: Optional[str] = Query(None, description="Return ids >= this one, in id order"),
+    to_id: Optional[str] = Query(None, description="Return ids <= this one, in id order"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    token: dict = Depends(authenticated),
+):
+    await run_in_threadpool(tx_index.sync, db)
+    try: start = int(cursor) if cursor else 0
+    except ValueError: raise HTTPException(status_code=400, detail="Invalid cursor")
+    bounds = [None if b is None else (b if b.tzinfo else b.replace(tzinfo=timezone.utc)).timestamp() for b in (since, until)]
+    # Idempotency bookkeeping records are never part of the history.
+    if type and action:
+        predicate = lambda t: t.get("action") == action
+    else:
+        predicate = lambda t: storage.record_kind(t) != IDEMPOTENCY_ACTION
+    if from_id or to_id:
+        id_range = [None if v is None else ids.id_key(int(v) if v.isdigit() else v) for v in (from_id, to_id)]
+        if any(v is None and raw for v, raw in zip(id_range, (from_id, to_id))):
+            raise HTTPException(status_code=400, detail="Invalid id bound")
+        low = max(start, id_range[0] or 0) if cursor else id_range[0]
+        rows = tx_index.scan_ids(low, id_range[1], kind=type or action, since=bounds[0], until=bounds[1], predicate=predicate)
+    else:
+        rows = tx_index.scan(kind=type or action, start=start, since=bounds[0], until=bounds[1], predicate=predicate)
+
+    if format == "ndjson":
+        def stream():
+            for _, record in rows:
+                yield json.dumps(record) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    page = await run_in_threadpool(list, islice(rows, limit + 1))
+    next_cursor = str(page[limit][0]) if len(page) > limit else None
+    return {"data": [record for _, record in page[:limit]], "next_cursor": next_cursor}
 
 @app.post("/token", tags=["System"])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    if USER_DATA.get(form_data.username) == form_data.password:
-        return {"access_token": "Token", "token_type": "bearer"}
+    if await run_in_threadpool(auth.check_credentials, USER_DATA, form_data.username, form_data.password):
+        return {"access_token": token_signer.issue(form_data.username), "token_type": "bearer", "expires_in": TOKEN_TTL}
     raise HTTPException(status_code=401, detail="Invalid Credentials")
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+# --- PRIMITIVES ---
+# Updates are plain in-place increments without locks: under the GIL a rare
+# lost increment from a concurrent thread is an acceptable price for keeping
+# the hot path to a couple of attribute writes.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Family:
+    """A named metric with one preallocated child per label combination."""
+
+    def __init__(self, kind, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            if self.kind == "counter":
+                lines.append(f"{self.name}{format_labels(self.labelnames, values)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames + ('le',), values + (le,))} {cumulative}")
+            labels = format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value computed at scrape time by ``fn``."""
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        try: value = self.fn()
+        except Exception: return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Family("counter", name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Family("histogram", name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        return self._add(Gauge(name, help, fn))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+HTTP_REQUESTS = REGISTRY.counter("qbn_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("qbn_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+VALIDATION_LATENCY = REGISTRY.histogram("qbn_validation_duration_seconds", "Pydantic model validation time.", ("model",), FAST_BUCKETS)
+STORAGE_LATENCY = REGISTRY.histogram("qbn_storage_operation_duration_seconds", "Persistence layer latency.", ("operation",))
+LOOP_LAG = REGISTRY.histogram("qbn_event_loop_lag_seconds", "How late the event loop woke a periodic probe.", (), FAST_BUCKETS + (0.1, 0.25, 0.5, 1.0))
+
+# Preallocated children for the storage hot paths.
+STORAGE_WRITE = STORAGE_LATENCY.labels("write")
+STORAGE_FSYNC = STORAGE_LATENCY.labels("fsync")
+STORAGE_READ = STORAGE_LATENCY.labels("read")
+LOOP_LAG_ALL = LOOP_LAG.labels()
+
+
+# --- ASGI INSTRUMENTATION ---
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route request counts and latency, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
+
+
+async def monitor_loop_lag(interval=0.25):
+    """Sleep ``interval`` repeatedly and record how late each wake-up is."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG_ALL.observe(max(0.0, loop.time() - expected))
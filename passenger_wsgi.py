@@ -5,5 +5,7 @@ from main import app
 sys.path.insert(0, os.path.dirname(__file__))
 
 # Menggunakan ASGI ke WSGI wrapper untuk FastAPI
+# Catatan: jembatan ini memproses satu request per proses; untuk produksi
+# gunakan serve.py atau gunicorn_conf.py (ASGI native, lihat benchmarks/deployment.py)
 from a2wsgi import ASGIMiddleware
 application = ASGIMiddleware(app)
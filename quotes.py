@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import ROUND_CEILING, Decimal
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+# Units of each currency per 1 USD. Illustrative defaults for environments
+# without a rates file; production points QBN_RATES_FILE at a maintained feed.
+DEFAULT_RATES = {
+    "USD": 1.0, "IDR": 16250.0, "EUR": 0.92, "GBP": 0.79, "SGD": 1.35, "JPY": 150.0,
+    "AUD": 1.52, "CHF": 0.88, "CAD": 1.36, "HKD": 7.8, "CNY": 7.2, "MYR": 4.7,
+}
+
+# --- RATE SOURCES ---
+class StaticRateSource:
+    def __init__(self, rates=DEFAULT_RATES, base="USD"):
+        self.rates = dict(rates)
+        self.base = base
+
+    def load(self):
+        return self.base, dict(self.rates)
+
+
+class JsonFileRateSource:
+    """Local rates file: ``{"base": "USD", "rates": {"IDR": 16250.0, ...}}``; re-read on every refresh."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        with open(self.path) as f:
+            doc = json.load(f)
+        rates = {code.upper(): float(value) for code, value in doc["rates"].items()}
+        rates[doc["base"].upper()] = 1.0
+        return doc["base"].upper(), rates
+
+
+class RateTable:
+    """Cross rates for every currency pair, rebuilt from the source and swapped in atomically."""
+
+    def __init__(self, source):
+        self.source = source
+        self.pairs = {}
+        self.updated = None
+
+    def refresh(self):
+        _, rates = self.source.load()
+        usable = {code: rate for code, rate in rates.items() if math.isfinite(rate) and rate > 0}
+        if not usable:
+            raise ValueError("Rate source returned no usable rates")
+        if len(usable) < len(rates):
+            logger.warning("Ignoring zero, negative or non-finite FX rates for %s", ", ".join(sorted(set(rates) - set(usable))))
+        self.pairs = {(s, t): usable[t] / usable[s] for s in usable for t in usable}
+        self.updated = time.time()
+
+    def rate(self, source, target):
+        return self.pairs.get((source.upper(), target.upper()))
+
+    async def refresh_periodically(self, interval):
+        """Reload every ``interval`` seconds; a failed reload keeps serving the last good table."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("FX rate refresh failed; keeping rates from %s", self.updated)
+
+
+# --- QUOTES ---
+# ISO 4217 minor units where they differ from the usual two decimals.
+MINOR_UNITS = {"JPY": 0, "KRW": 0, "VND": 0, "CLP": 0, "ISK": 0, "BHD": 3, "KWD": 3, "OMR": 3, "JOD": 3, "TND": 3}
+
+def isoformat(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+def round_up(amount, currency):
+    """Round a Decimal ``amount`` up to ``currency``'s minor unit, so a priced amount is never undercharged."""
+    step = Decimal(1).scaleb(-MINOR_UNITS.get(currency, 2))
+    return float(amount.quantize(step, rounding=ROUND_CEILING))
+
+def expired(quote, now=None):
+    return datetime.fromisoformat(quote["expirationTime"]).timestamp() <= (time.time() if now is None else now)
+
+
+class QuoteBook:
+    """Prices quotes and keeps them, until they expire, in a lock table shared by every worker.
+
+    The table is a directory with one small file per quote id, outside the
+    transaction log: issuing a quote costs no log write or fsync, and a worker
+    that did not issue a quote reads it by name in O(1). A quote reaches the
+    log only when a transfer consumes it, and whether it was already used is
+    decided by the log, not by this table.
+    """
+
+    def __init__(self, directory, ttl=1800, maxsize=100000):
+        self.directory = directory
+        self.ttl = ttl
+        self.issued = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        os.makedirs(directory, exist_ok=True)
+
+    def issue(self, profile_id, source_currency, target_currency, target_amount, target_account, rate):
+        now = time.time()
+        source, target = source_currency.upper(), target_currency.upper()
+        return {
+            "id": str(uuid.uuid4()), "profile": profile_id, "sourceCurrency": source, "targetCurrency": target,
+            "sourceAmount": round_up(Decimal(repr(target_amount)) / Decimal(repr(rate)), source), "targetAmount": target_amount,
+            "targetAccount": target_account, "rate": rate,
+            "createdTime": isoformat(now), "expirationTime": isoformat(now + self.ttl), "status": "READY",
+        }
+
+    def _path(self, quote_id):
+        try: return os.path.join(self.directory, str(uuid.UUID(quote_id)))
+        except (TypeError, ValueError): return None
+
+    def remember(self, quote):
+        """Publish ``quote`` to the other workers. Not fsynced: a quote lost in a crash is simply re-requested."""
+        path = self._path(quote["id"])
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(quote, f)
+        os.replace(tmp, path)
+        self.issued.set(quote["id"], quote)
+
+    def get(self, quote_id):
+        """A quote issued by this worker, from memory."""
+        return self.issued.get(quote_id)
+
+    def load(self, quote_id):
+        """A quote issued by any worker, from the shared table."""
+        path = self._path(quote_id)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                quote = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.issued.set(quote_id, quote)
+        return quote
+
+    def sweep(self):
+        """Delete table entries older than the quote TTL; returns how many were removed."""
+        cutoff, removed = time.time() - self.ttl, 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime <= cutoff:
+                        os.unlink(entry.path); removed += 1
+                except FileNotFoundError:
+                    pass  # another worker swept it first
+        return removed
+
+    async def sweep_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Quote table sweep failed")
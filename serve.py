@@ -0,0 +1,71 @@
+"""Production launcher: the FastAPI app served natively over ASGI, without the a2wsgi bridge.
+
+    python serve.py                          # uvicorn, worker count autotuned
+    python serve.py --workers 4 --port 8080
+    gunicorn -c gunicorn_conf.py main:app    # same settings under gunicorn
+
+Settings come from the command line or the environment: ``QBN_HOST``,
+``QBN_PORT``, ``WEB_CONCURRENCY`` and ``QBN_GRACEFUL_TIMEOUT``. uvloop and
+httptools are used when installed (``pip install uvloop httptools``;
+gunicorn is likewise optional) and skipped otherwise. On SIGTERM the
+server stops accepting connections, waits for in-flight requests, then the
+app's shutdown hooks drain the storage writer queue and fsync the log.
+"""
+import argparse
+import importlib.util
+import os
+
+import ids
+
+HOST = os.getenv("QBN_HOST", "0.0.0.0")
+PORT = int(os.getenv("QBN_PORT", "8000"))
+GRACEFUL_TIMEOUT = int(os.getenv("QBN_GRACEFUL_TIMEOUT", "30"))
+
+
+def available(module):
+    return importlib.util.find_spec(module) is not None
+
+def cpu_count():
+    """CPUs this process may actually use, honouring affinity masks and cgroup v2 quotas."""
+    try: cpus = len(os.sched_getaffinity(0))
+    except AttributeError: cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def autotune_workers():
+    """One async worker per usable CPU, capped by the id generator's worker slots."""
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    return max(1, min(cpu_count(), ids.MAX_WORKERS))
+
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Run the Quantum Institutional Gateway under uvicorn.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="default: autotuned from available CPUs")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers or autotune_workers(),
+        loop="uvloop" if available("uvloop") else "asyncio",
+        http="httptools" if available("httptools") else "h11",
+        lifespan="on",
+        proxy_headers=True,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,603 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import ids
+from metrics import STORAGE_FSYNC, STORAGE_READ, STORAGE_WRITE
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX hosts: in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- FILE HELPERS ---
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """Inter-process advisory lock on a sidecar ``.lock`` file."""
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the flock
+
+def atomic_write(path, payload):
+    """Write ``payload`` to a temp file, fsync it and rename it over ``path``."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as out:
+        out.write(payload)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, path)
+
+def encode_record(record):
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+def split_log(payload):
+    """Split raw log bytes into ``(good, bad)`` lines; a last line with no newline is a torn write."""
+    good, bad = [], []
+    *lines, tail = payload.split(b"\n")
+    for line in lines:
+        if not line.strip():
+            continue
+        try: json.loads(line)
+        except ValueError: bad.append(line); continue
+        good.append(line)
+    if tail:
+        bad.append(tail)
+    return good, bad
+
+
+# --- STORAGE BACKENDS ---
+class StorageBackend:
+    """Minimal persistence contract used by ``main.save_to_db``."""
+
+    def append(self, record):
+        raise NotImplementedError
+
+    def append_many(self, records, guard=None):
+        """Append ``records``; ``guard()`` runs first and may raise to reject them.
+
+        Backends that share the log between processes run the guard under
+        their exclusive write lock, so a check-then-write cannot race.
+        """
+        if guard is not None:
+            guard()
+        seq = 0
+        for record in records:
+            seq = self.append(record)
+        return seq
+
+    def read_all(self):
+        raise NotImplementedError
+
+    def read_since(self, cursor):
+        """Return ``(records, cursor, reset)`` for records written after ``cursor``.
+
+        ``cursor`` is opaque (``None`` means "from the beginning"). When
+        ``reset`` is true the caller must discard what it has and rebuild from
+        ``records``.
+        """
+        records = self.read_all()
+        start = cursor or 0
+        if start > len(records):
+            return records, len(records), True
+        return records[start:], len(records), False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonArrayStorage(StorageBackend):
+    """Legacy backend: the whole history as one JSON array, rewritten on every append.
+
+    Writes are atomic (temp file + rename) under an inter-process lock, and a
+    file that fails to parse raises instead of being silently replaced. A
+    write guard only runs under the in-process lock: it reads the log
+    through ``read_all``, which takes the file lock itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            try: return json.load(f)
+            except ValueError as exc: raise ValueError(f"{self.path} is corrupt: {exc}") from exc
+
+    def read_all(self):
+        started = time.perf_counter()
+        with file_lock(self.lock_path, shared=True):
+            transactions = self._load()
+        STORAGE_READ.observe(time.perf_counter() - started)
+        return transactions
+
+    def append_many(self, records, guard=None):
+        with self._lock:
+            if guard is not None:
+                guard()
+            with file_lock(self.lock_path):
+                started = time.perf_counter()
+                transactions = self._load()
+                transactions.extend(records)
+                atomic_write(self.path, json.dumps(transactions, indent=4).encode("utf-8"))
+                STORAGE_WRITE.observe(time.perf_counter() - started)
+                return len(transactions)
+
+    def append(self, record):
+        return self.append_many([record])
+
+
+class JsonLinesStorage(StorageBackend):
+    """Append-only JSON-lines log with group commit and on-demand compaction.
+
+    Each append is a single ``O_APPEND`` write of the encoded records, taken
+    under an exclusive ``flock`` so several worker processes can share the log.
+    ``fsync`` is batched: it runs once ``fsync_batch`` records are pending or
+    ``fsync_interval`` seconds have passed, whichever comes first; ``flush``
+    forces it.
+
+    The log is only rewritten when it holds something to drop: a torn write
+    left by a crashed writer, or a line that no longer parses (noticed by
+    ``read_since``). Those lines are moved to ``<path>.corrupt`` rather than
+    discarded. Compaction is keyed on the damaged file's inode, so when
+    several processes notice the same damage only the first one rewrites;
+    the others see the new inode and reopen.
+    """
+
+    def __init__(self, path, legacy_path=None, fsync_interval=0.05, fsync_batch=64):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.corrupt_path = path + ".corrupt"
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self._lock = threading.Lock()
+        self._seq = 0  # records appended by this process
+        self._synced_seq = 0
+        self._damaged_inode = None
+        self._closed = False
+        with file_lock(self.lock_path):
+            if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+                migrate_json_array(legacy_path, path)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            self._close_torn_tail()
+        self._flusher = threading.Thread(target=self._flush_loop, name="qbn-storage-fsync", daemon=True)
+        self._flusher.start()
+
+    def _reopen_if_replaced(self):
+        try: current = os.stat(self.path).st_ino
+        except FileNotFoundError: current = None
+        if current != os.fstat(self._fd).st_ino:
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _close_torn_tail(self):
+        """Caller holds the file lock. A crashed writer may have left a torn last line:
+        end it with a newline so it cannot swallow the next write, and flag it for compaction."""
+        stat = os.fstat(self._fd)
+        if stat.st_size and os.pread(self._fd, 1, stat.st_size - 1) != b"\n":
+            os.write(self._fd, b"\n")
+            self._damaged_inode = stat.st_ino
+
+    def read_since(self, cursor):
+        started = time.perf_counter()
+        try: fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError: return [], None, cursor is not None
+        try:
+            inode, size = os.fstat(fd).st_ino, os.fstat(fd).st_size
+            reset = cursor is not None and cursor[0] != inode
+            offset = 0 if cursor is None or reset else cursor[1]
+            if offset > size:
+                offset, reset = 0, True
+            chunk = os.pread(fd, size - offset, offset)
+        finally:
+            os.close(fd)
+        end = chunk.rfind(b"\n") + 1  # leave a partially written line for the next call
+        records = []
+        for line in chunk[:end].splitlines():
+            if not line.strip(): continue
+            try: records.append(json.loads(line))
+            except ValueError: self._damaged_inode = inode
+        STORAGE_READ.observe(time.perf_counter() - started)
+        return records, (inode, offset + end), reset
+
+    def append_many(self, records, guard=None):
+        payload = b"".join(encode_record(r) for r in records)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("storage is closed")
+            started = time.perf_counter()
+            with file_lock(self.lock_path):
+                if guard is not None:
+                    guard()  # sees every process's writes; nobody can append until we are done
+                self._reopen_if_replaced()
+                self._close_torn_tail()
+                view = memoryview(payload)
+                while view:
+                    view = view[os.write(self._fd, view):]
+            STORAGE_WRITE.observe(time.perf_counter() - started)
+            self._seq += len(records)
+            if self._seq - self._synced_seq >= self.fsync_batch:
+                self._sync_locked()
+            if self._damaged_inode is not None:
+                self._compact_locked()
+            return self._seq
+
+    def append(self, record):
+        return self.append_many([record])
+
+    def _sync_locked(self):
+        if self._synced_seq == self._seq:
+            return
+        started = time.perf_counter()
+        os.fsync(self._fd)
+        STORAGE_FSYNC.observe(time.perf_counter() - started)
+        self._synced_seq = self._seq
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._closed:
+                    return
+                self._sync_locked()
+
+    def _compact_locked(self):
+        """Move torn and unparsable lines to ``corrupt_path`` and rewrite the log without them.
+
+        Only runs for the inode damage was seen in: if another process has
+        already replaced that file, there is nothing left to do.
+        """
+        self._sync_locked()
+        damaged, self._damaged_inode = self._damaged_inode, None
+        with file_lock(self.lock_path):
+            try:
+                if os.stat(self.path).st_ino != damaged:
+                    return
+            except FileNotFoundError:
+                return
+            with open(self.path, "rb") as f:
+                good, bad = split_log(f.read())
+            if bad:
+                with open(self.corrupt_path, "ab") as out:
+                    out.write(b"".join(line + b"\n" for line in bad))
+                    out.flush()
+                    os.fsync(out.fileno())
+                atomic_write(self.path, b"".join(line + b"\n" for line in good))
+                self._reopen_if_replaced()
+                logger.warning("%s: moved %d torn or unparsable line(s) to %s", self.path, len(bad), self.corrupt_path)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._sync_locked()
+            self._closed = True
+            os.close(self._fd)
+
+
+class AsyncWriter:
+    """Single writer task that owns every append made by this process.
+
+    ``submit`` enqueues records on a bounded queue (``queue_depth``) and
+    resolves once they are fsynced; when the queue is full, callers wait,
+    which is the backpressure. The writer drains up to ``max_batch`` pending
+    submissions, commits them with one ``append_many`` and one fsync on a
+    dedicated thread, then runs ``on_commit`` on that same thread.
+    Submissions with a ``guard`` are appended one by one after the rest, so
+    each guard sees every write queued ahead of it.
+    """
+
+    def __init__(self, backend, queue_depth=1024, max_batch=256, on_commit=None):
+        self.backend = backend
+        self.queue_depth = queue_depth
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self._queue = None
+        self._task = None
+        self._executor = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qbn-writer")
+            self._queue = asyncio.Queue(self.queue_depth)
+            self._task = loop.create_task(self._run())
+
+    @property
+    def pending(self):
+        return 0 if self._queue is None else self._queue.qsize()
+
+    async def submit(self, records, guard=None):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, guard, future))
+        return await future
+
+    def _commit(self, batch):
+        """Return one outcome per submission: its sequence number, or the exception its guard raised."""
+        plain = [r for records, guard in batch if guard is None for r in records]
+        seq = self.backend.append_many(plain) if plain else None
+        outcomes = []
+        for records, guard in batch:
+            if guard is None:
+                outcomes.append(seq); continue
+            try: outcomes.append(self.backend.append_many(records, guard=guard))
+            except Exception as exc: outcomes.append(exc)
+        self.backend.flush()
+        if self.on_commit is not None:
+            self.on_commit()
+        return outcomes
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if not batch:
+                continue
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._commit, [(records, guard) for records, guard, _ in batch])
+            except Exception as exc:
+                outcomes = [exc] * len(batch)
+            for (_, _, future), outcome in zip(batch, outcomes):
+                if future.done(): continue
+                if isinstance(outcome, Exception): future.set_exception(outcome)
+                else: future.set_result(outcome)
+
+    async def close(self):
+        """Commit everything already queued, then stop the writer task."""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(None)
+            await self._task
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def migrate_json_array(legacy_path, log_path):
+    """One-shot conversion of the legacy ``database_anc.json`` array into a JSON-lines log."""
+    with open(legacy_path, "r") as f:
+        transactions = json.load(f)
+    atomic_write(log_path, b"".join(encode_record(r) for r in transactions))
+    os.replace(legacy_path, legacy_path + ".migrated")
+    return len(transactions)
+
+
+# --- IN-MEMORY INDEX ---
+def record_id(record):
+    if "id" in record:
+        return record["id"]
+    data = record.get("data") or {}
+    for key in ("id", "transactionId"):
+        if key in data:
+            return data[key]
+    return None
+
+def record_kind(record):
+    return record.get("action") or record.get("type")
+
+def record_currency(record):
+    body = record.get("data") or record.get("details") or {}
+    return body.get("currency")
+
+def record_time(record):
+    stamp = record.get("timestamp")
+    if not stamp:
+        return None
+    try: moment = datetime.fromisoformat(stamp)
+    except ValueError: return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+class IndexTables:
+    """One generation of the index: the records in append order plus every lookup table.
+
+    Each index maps a key to positions in ``records``, so lookups cost
+    O(result size). ``time_high`` (running maximum of record times) and
+    ``time_lows`` (the ``(time, position)`` suffix minima) stay sorted even
+    when workers commit slightly out of timestamp order, so a time window can
+    be turned into a position range with two bisects.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.by_kind = {}
+        self.by_currency = {}
+        self.by_kind_currency = {}
+        self.by_id = {}
+        self.id_order = []
+        self.by_idempotency_key = {}
+        self.by_quote_use = {}
+        self.times = []
+        self.time_high = []
+        self.time_lows = []
+
+    def extend(self, records):
+        for record in records:
+            pos = len(self.records)
+            self.records.append(record)
+            moment = record_time(record)
+            self.times.append(moment)
+            high = self.time_high[-1] if self.time_high else float("-inf")
+            self.time_high.append(high if moment is None or moment < high else moment)
+            if moment is not None:
+                while self.time_lows and self.time_lows[-1][0] >= moment:
+                    self.time_lows.pop()
+                self.time_lows.append((moment, pos))
+            kind, currency, tx_id = record_kind(record), record_currency(record), record_id(record)
+            if kind is not None:
+                self.by_kind.setdefault(kind, []).append(pos)
+            if currency is not None:
+                self.by_currency.setdefault(currency, []).append(pos)
+                self.by_kind_currency.setdefault((kind, currency), []).append(pos)
+            if "idempotency_key" in record:
+                self.by_idempotency_key.setdefault(record["idempotency_key"], pos)
+            data = record.get("data")
+            if isinstance(data, dict) and "quoteUuid" in data:
+                self.by_quote_use.setdefault(data["quoteUuid"], pos)
+            if tx_id is not None:
+                self.by_id[str(tx_id)] = pos
+                key = ids.id_key(tx_id)
+                if key is not None:
+                    if self.id_order and key < self.id_order[-1][0]:
+                        insort(self.id_order, (key, pos))  # another worker's id committed late
+                    else:
+                        self.id_order.append((key, pos))
+
+    def window(self, since=None, until=None):
+        """Smallest ``[first, stop)`` position range holding every record timed within ``[since, until]``."""
+        first = 0 if since is None else bisect_left(self.time_high, since)
+        if until is None:
+            return first, len(self.records)
+        i = bisect_right(self.time_lows, (until, float("inf")))
+        return first, self.time_lows[i - 1][1] + 1 if i else 0
+
+
+def in_window(moment, since, until):
+    return moment is not None and (since is None or moment >= since) and (until is None or moment <= until)
+
+
+class TransactionIndex:
+    """Process-resident copy of the log with secondary indexes.
+
+    The tables live in one ``IndexTables`` generation. ``sync`` extends it in
+    place, but after a compaction it builds a new generation and swaps it in
+    with a single assignment. Readers bind the generation, and its length,
+    when they start, so a running export never sees a half-built index.
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._cursor = None
+        self.tables = IndexTables()
+        self.extend(records)
+
+    def sync(self, backend):
+        """Pull records appended to ``backend`` since the last call, by any process."""
+        with self._sync_lock:
+            records, self._cursor, reset = backend.read_since(self._cursor)
+            if reset:
+                fresh = IndexTables()
+                fresh.extend(records)
+                with self._lock:
+                    self.tables = fresh
+            else:
+                self.extend(records)
+
+    def __len__(self):
+        return len(self.tables.records)
+
+    def extend(self, records):
+        with self._lock:
+            self.tables.extend(records)
+
+    def find(self, kind=None, currency=None):
+        t = self.tables
+        if kind is not None and currency is not None:
+            positions = t.by_kind_currency.get((kind, currency), ())
+        elif kind is not None:
+            positions = t.by_kind.get(kind, ())
+        elif currency is not None:
+            positions = t.by_currency.get(currency, ())
+        else:
+            return list(t.records)
+        return [t.records[p] for p in positions]
+
+    def _lookup(self, table, key):
+        t = self.tables
+        pos = getattr(t, table).get(key)
+        return None if pos is None else t.records[pos]
+
+    def get(self, tx_id):
+        return self._lookup("by_id", str(tx_id))
+
+    def get_quote_use(self, quote_id):
+        return self._lookup("by_quote_use", quote_id)
+
+    def get_idempotent(self, key):
+        return self._lookup("by_idempotency_key", key)
+
+    def scan_ids(self, low=None, high=None, kind=None, since=None, until=None, predicate=None):
+        """Yield ``(id_key, record)`` in id order for ids in ``[low, high]`` (see ``ids.id_key``)."""
+        return self._scan_ids(self.tables, low, high, kind, since, until, predicate)
+
+    @staticmethod
+    def _scan_ids(t, low, high, kind, since, until, predicate):
+        order = t.id_order
+        i = 0 if low is None else bisect_left(order, (low, -1))
+        bounded = since is not None or until is not None
+        while i < len(order):
+            key, pos = order[i]
+            i += 1
+            if high is not None and key > high: return
+            record = t.records[pos]
+            if kind is not None and record_kind(record) != kind: continue
+            if bounded and not in_window(t.times[pos], since, until): continue
+            if predicate is None or predicate(record):
+                yield key, record
+
+    def scan(self, kind=None, start=0, since=None, until=None, predicate=None):
+        """Yield ``(position, record)`` in append order from ``start`` onwards.
+
+        ``since``/``until`` are epoch seconds; records without a timestamp are
+        skipped whenever either bound is given. The time window is bisected to
+        a position range first, so a narrow or empty window costs O(log n).
+        """
+        t = self.tables
+        first, stop = t.window(since, until)
+        first = max(first, start)
+        if kind is None:
+            positions = range(first, stop)
+        else:
+            kind_positions = t.by_kind.get(kind, [])
+            positions = (kind_positions[i] for i in range(bisect_left(kind_positions, first), bisect_left(kind_positions, stop)))
+        return self._scan(t, positions, since, until, predicate)
+
+    @staticmethod
+    def _scan(t, positions, since, until, predicate):
+        bounded = since is not None or until is not None
+        for pos in positions:
+            if bounded and not in_window(t.times[pos], since, until): continue
+            record = t.records[pos]
+            if predicate is None or predicate(record):
+                yield pos, record
+
+
+BACKENDS = {"jsonl": JsonLinesStorage, "json": JsonArrayStorage}
+
+def open_storage(kind, path, **options):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {kind}")
+    return BACKENDS[kind](path, **options)
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# main.py opens its log, token secret and quote table at import time: point them at a scratch directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QBN_LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="qbn-tests-"), "database_anc.jsonl"))
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import storage
+
+FIAT = {"sender_bank": "Bank", "account_name": "Acme", "amount": 100.0, "currency": "USD", "swift_code": "BANKUS33", "payout_wallet": "w-1"}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def headers(client):
+    token = client.post("/token", data={"username": "admin", "password": "Arjuna2026!"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def quote(client, headers, target_account=7):
+    body = {"sourceCurrency": "USD", "targetCurrency": "IDR", "targetAmount": 16250, "payOut": "BANK_TRANSFER",
+            "preferredPayIn": "BANK_TRANSFER", "targetAccount": target_account}
+    res = client.post("/v3/profiles/1/quotes", json=body, headers=headers)
+    assert res.status_code == 200
+    return res.json()
+
+
+def transfer(client, headers, quote_id, customer_id, target_account=7):
+    body = {"targetAccount": target_account, "quoteUuid": quote_id, "customerTransactionId": customer_id, "details": {}}
+    return client.post("/v1/transfers", json=body, headers=headers)
+
+
+def test_forged_or_missing_token_is_401(client, headers):
+    token = headers["Authorization"].split()[1]
+    forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    assert client.get("/v1/accounts?currency=USD", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+    assert client.get("/v1/accounts?currency=USD").status_code == 401
+
+
+def test_idempotent_replay(client, headers):
+    key = {**headers, "Idempotency-Key": "replay-1"}
+    first = client.post("/api/v1/settlement/submit-fiat", json=FIAT, headers=key)
+    again = client.post("/api/v1/settlement/submit-fiat", json=FIAT, headers=key)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    main.tx_index.sync(main.db)
+    assert sum(1 for r in main.tx_index.tables.records if r.get("id") == first.json()["transaction_id"]) == 1
+
+
+def test_idempotency_key_reused_with_another_body_is_409(client, headers):
+    key = {**headers, "Idempotency-Key": "replay-2"}
+    assert client.post("/api/v1/settlement/submit-fiat", json=FIAT, headers=key).status_code == 200
+    assert client.post("/api/v1/settlement/submit-fiat", json={**FIAT, "amount": 101.0}, headers=key).status_code == 409
+
+
+def test_key_committed_by_another_worker_during_build_is_replayed(client, headers):
+    other = storage.JsonLinesStorage(main.LOG_FILE)
+    digest = main.request_digest({"n": 1})
+
+    def build():
+        other.append_many([{"id": "OTHER-1"}, {"action": main.IDEMPOTENCY_ACTION, "idempotency_key": "race:k",
+                                               "request_hash": digest, "response": {"winner": "other"}}])
+        return {"id": "MINE-1"}, {"winner": "me"}
+
+    async def run():
+        return await main.idempotent("race", "k", {"n": 1}, build)
+    try:
+        res = client.portal.call(run)
+    finally:
+        other.close()
+    assert res.body == b'{"winner":"other"}'
+    main.tx_index.sync(main.db)
+    assert main.tx_index.get("MINE-1") is None
+
+
+def test_quote_is_single_use(client, headers):
+    q = quote(client, headers)
+    assert q["sourceAmount"] == 1.0
+    assert transfer(client, headers, q["id"], "single-1", target_account=8).status_code == 422
+    first = transfer(client, headers, q["id"], "single-1")
+    assert first.status_code == 200 and first.json()["quoteUuid"] == q["id"]
+    assert transfer(client, headers, q["id"], "single-2").status_code == 422
+    assert transfer(client, headers, q["id"], "single-1").json() == first.json()  # same customerTransactionId replays
+
+
+def test_quote_issued_by_another_worker_is_found(client, headers, monkeypatch):
+    q = quote(client, headers)
+    monkeypatch.setattr(main.quote_book, "issued", main.cache.TTLCache())  # this worker never saw it
+    assert transfer(client, headers, q["id"], "shared-1").status_code == 200
+
+
+def test_unknown_quote_is_422(client, headers):
+    assert transfer(client, headers, "00000000-0000-0000-0000-000000000000", "unknown-1").status_code == 422
+    assert transfer(client, headers, "../database_anc.jsonl", "unknown-2").status_code == 422
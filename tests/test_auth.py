@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import auth
+
+
+@pytest.fixture
+def signer():
+    return auth.TokenSigner(b"test-secret", ttl=60)
+
+
+def test_issued_token_verifies(signer):
+    assert signer.verify(signer.issue("admin"))["sub"] == "admin"
+
+
+def test_expired_token_is_refused(signer):
+    signer.ttl = 0
+    with pytest.raises(auth.TokenError, match="expired"):
+        signer.verify(signer.issue("admin"))
+
+
+def test_tampered_claims_are_refused(signer):
+    payload, signature = signer.issue("admin").split(".")
+    claims = json.loads(auth.b64decode(payload))
+    claims["exp"] += 86400
+    forged = auth.b64encode(json.dumps(claims, separators=(",", ":")).encode()) + "." + signature
+    with pytest.raises(auth.TokenError, match="signature"):
+        signer.verify(forged)
+
+
+def test_token_from_another_key_is_refused(signer):
+    with pytest.raises(auth.TokenError, match="signature"):
+        signer.verify(auth.TokenSigner(b"other-secret").issue("admin"))
+
+
+@pytest.mark.parametrize("token", ["", "garbage", "abc.def", "."])
+def test_malformed_token_is_refused(signer, token):
+    with pytest.raises(auth.TokenError):
+        signer.verify(token)
+
+
+def test_passwords():
+    encoded = auth.hash_password("s3cret", iterations=1000)
+    assert auth.verify_password("s3cret", encoded)
+    assert not auth.verify_password("S3cret", encoded)
+    assert not auth.check_credentials({"admin": encoded}, "nobody", "s3cret")
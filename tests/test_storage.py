@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / "log.jsonl")
+
+
+def lines(path):
+    with open(path, "rb") as f:
+        return f.read().splitlines()
+
+
+def test_two_instances_share_one_log(log_path):
+    a, b = storage.JsonLinesStorage(log_path), storage.JsonLinesStorage(log_path)
+    index_a, index_b = storage.TransactionIndex(), storage.TransactionIndex()
+    try:
+        a.append_many([{"id": "A-1", "action": "ACCOUNT_CREATED", "data": {"currency": "USD"}}])
+        b.append_many([{"id": "B-1"}, {"action": "IDEMPOTENCY_KEY", "idempotency_key": "k", "request_hash": "h", "response": {}}])
+        a.append({"id": "A-2"})
+        index_a.sync(a); index_b.sync(b)
+        for index in (index_a, index_b):
+            assert len(index) == 4
+            assert [index.get(tx_id)["id"] for tx_id in ("A-1", "B-1", "A-2")] == ["A-1", "B-1", "A-2"]
+            assert index.get_idempotent("k") is not None
+            assert [r["id"] for r in index.find(kind="ACCOUNT_CREATED", currency="USD")] == ["A-1"]
+        b.append({"id": "B-2"})
+        index_a.sync(a)
+        assert index_a.get("B-2") is not None and len(index_a) == 5
+    finally:
+        a.close(); b.close()
+    assert len(lines(log_path)) == 5
+
+
+def test_guard_runs_under_the_lock_and_can_refuse(log_path):
+    a, b = storage.JsonLinesStorage(log_path), storage.JsonLinesStorage(log_path)
+    index = storage.TransactionIndex()
+
+    def unused():
+        index.sync(a)
+        if index.get_quote_use("q") is not None:
+            raise ValueError("used")
+    try:
+        b.append({"id": "T-1", "data": {"quoteUuid": "q"}})
+        with pytest.raises(ValueError):
+            a.append_many([{"id": "T-2", "data": {"quoteUuid": "q"}}], guard=unused)
+    finally:
+        a.close(); b.close()
+    assert [json.loads(line)["id"] for line in lines(log_path)] == ["T-1"]
+
+
+def test_torn_tail_is_quarantined(log_path):
+    with open(log_path, "wb") as f:
+        f.write(b'{"id": "A-1"}\n{"id": "A-2", "da')  # writer crashed mid-line
+    db = storage.JsonLinesStorage(log_path)
+    try:
+        db.append({"id": "A-3"})
+        index = storage.TransactionIndex()
+        index.sync(db)
+        assert [index.get(tx_id) is not None for tx_id in ("A-1", "A-2", "A-3")] == [True, False, True]
+    finally:
+        db.close()
+    assert [json.loads(line)["id"] for line in lines(log_path)] == ["A-1", "A-3"]
+    assert lines(log_path + ".corrupt") == [b'{"id": "A-2", "da']
+
+
+def test_unparsable_line_is_quarantined_after_read(log_path):
+    with open(log_path, "wb") as f:
+        f.write(b'{"id": "A-1"}\nnot json\n{"id": "A-2"}\n')
+    db = storage.JsonLinesStorage(log_path)
+    try:
+        index = storage.TransactionIndex()
+        index.sync(db)
+        assert len(index) == 2
+        db.append({"id": "A-3"})
+        index.sync(db)  # the rewrite replaced the file: the index rebuilds from it
+        assert len(index) == 3 and index.get("A-3") is not None
+    finally:
+        db.close()
+    assert [json.loads(line)["id"] for line in lines(log_path)] == ["A-1", "A-2", "A-3"]
+    assert lines(log_path + ".corrupt") == [b"not json"]
+
+
+def test_damage_is_rewritten_once_across_instances(log_path):
+    with open(log_path, "wb") as f:
+        f.write(b'{"id": "A-1"}\nnot json\n')
+    a, b = storage.JsonLinesStorage(log_path), storage.JsonLinesStorage(log_path)
+    try:
+        for db in (a, b):
+            storage.TransactionIndex().sync(db)  # both notice the bad line
+        a.append({"id": "A-2"})
+        inode = os.stat(log_path).st_ino
+        b.append({"id": "B-1"})
+        assert os.stat(log_path).st_ino == inode
+    finally:
+        a.close(); b.close()
+    assert [json.loads(line)["id"] for line in lines(log_path)] == ["A-1", "A-2", "B-1"]
+    assert lines(log_path + ".corrupt") == [b"not json"]